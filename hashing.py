@@ -1,24 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
-from tempfile import SpooledTemporaryFile
-from zipfile import ZipFile
+import os
+from typing import Callable, Dict, Optional, Tuple
 
 from witmanager import COMMIT_ID_LENGTH, Text, WitManager
 
 
+Digests = Dict[Tuple[str, int, int], str]
+
+
+def _pick_impl() -> Callable[[bytes, int], bytes]:
+    """Return the fastest available one-shot BLAKE2b implementation."""
+    try:
+        import pysodium  # type: ignore
+    except ImportError:
+        def blake2b(content: bytes, outlen: int) -> bytes:
+            return hashlib.blake2b(content, digest_size=outlen).digest()
+        return blake2b
+
+    def sodium_blake2b(content: bytes, outlen: int) -> bytes:
+        return pysodium.crypto_generichash(content, outlen=outlen)
+    return sodium_blake2b
+
+
+_blake2b = _pick_impl()
+
+
 class Hashing:
     @staticmethod
-    def by_path(path: str) -> str:
-        """Return the file content."""
-        with SpooledTemporaryFile() as temp:
-            with ZipFile(temp, 'w') as archive:
-                for filename in WitManager.get_path_files(path):
-                    archive.write(
-                        filename
-                    )
-            temp.seek(0)
-            file_content = temp.read()
-            file_hash = Hashing.by_content(file_content)
-            return file_hash
+    def manifest(
+        path: str, known_digests: Optional[Digests] = None
+    ) -> str:
+        """Return the sorted manifest lines of a directory.
+
+        Every line holds a file relative path, size, mtime and hexdigest.
+        Digests are taken from known_digests when the file stat matches,
+        and the other files are hashed in a thread pool."""
+        if known_digests is None:
+            known_digests = {}
+        files = []
+        for filename in sorted(WitManager.get_path_files(path)):
+            stat = os.stat(filename)
+            files.append((
+                filename, os.path.relpath(filename, path),
+                stat.st_size, stat.st_mtime_ns
+            ))
+        to_hash = [
+            filename
+            for filename, rel_path, size, mtime_ns in files
+            if (rel_path, size, mtime_ns) not in known_digests
+        ]
+        with ThreadPoolExecutor() as executor:
+            new_digests = dict(
+                zip(to_hash, executor.map(WitManager.hash_file, to_hash))
+            )
+        lines = []
+        for filename, rel_path, size, mtime_ns in files:
+            file_hash = known_digests.get((rel_path, size, mtime_ns))
+            if file_hash is None:
+                file_hash = new_digests[filename]
+            lines.append(f'{rel_path}\t{size}\t{mtime_ns}\t{file_hash}\n')
+        return ''.join(lines)
+
+    @staticmethod
+    def read_manifest(manifest_path: str) -> str:
+        """Return the manifest saved in a file, empty if there is none."""
+        if not os.path.isfile(manifest_path):
+            return ''
+        with open(manifest_path, 'r') as file:
+            return file.read()
+
+    @staticmethod
+    def manifest_digests(manifest: str) -> Digests:
+        """Return the digests of a manifest, keyed by file stat."""
+        digests = {}
+        for line in manifest.splitlines():
+            rel_path, size, mtime_ns, file_hash = line.rsplit('\t', 3)
+            digests[(rel_path, int(size), int(mtime_ns))] = file_hash
+        return digests
 
     @staticmethod  # Credit to lms
     def by_content(file_content: Text) -> str:
@@ -27,6 +86,4 @@ class Hashing:
         In order to compare two same directories contents."""
         if not isinstance(file_content, bytes):
             file_content = file_content.encode('utf-8')
-        hashed_name = hashlib.blake2b(digest_size=(COMMIT_ID_LENGTH // 2))
-        hashed_name.update(file_content)
-        return hashed_name.hexdigest()
+        return _blake2b(file_content, COMMIT_ID_LENGTH // 2).hex()
@@ -3,9 +3,6 @@ import shutil
 import sys
 from typing import Any, Callable, Dict, Optional
 
-import matplotlib.pyplot as plt  # type: ignore
-import networkx as nx  # type: ignore
-
 from hashing import Hashing
 from witmanager import _logger, WitEditor, WitStatus
 
@@ -43,7 +40,7 @@ def add(path: str) -> None:
             src=wit.real_path, dst=wit.stage_dir, rel=wit.parent_wit_dir
         )
     else:
-        shutil.copy2(wit.real_path, final_dir)
+        wit.copy_file(wit.real_path, final_dir)
     _logger.info('%s has been added to the stage backup', wit.real_path)
 
 
@@ -51,7 +48,22 @@ def commit(message: str, branch_id: Optional[str] = None) -> None:
     """Commit a new request for a backup."""
     wit = WitEditor()
 
-    commit_id = Hashing.by_path(wit.stage_dir)
+    head_commit_id = wit.get_commit_id()
+    head_manifest_path = os.path.join(
+        wit.images_dir, f'{head_commit_id}.manifest'
+    )
+    head_manifest = Hashing.read_manifest(head_manifest_path)
+    manifest = Hashing.manifest(
+        wit.stage_dir, Hashing.manifest_digests(head_manifest)
+    )
+    if branch_id is None and head_manifest and manifest == head_manifest:
+        _logger.info('Nothing to commit, the staging area is unchanged')
+        return
+    # The parents are hashed too, so a tree seen before gets a new commit id
+    parents = f'{head_commit_id}'
+    if branch_id is not None:
+        parents += f',{branch_id}'
+    commit_id = Hashing.by_content(f'parent={parents}\n{manifest}')
     commit_id_images_dir = os.path.join(wit.images_dir, commit_id)
     try:
         os.mkdir(commit_id_images_dir)
@@ -61,7 +73,7 @@ def commit(message: str, branch_id: Optional[str] = None) -> None:
         )
     else:
         wit.create_metadata_file(message, commit_id, branch_id)
-        wit.image_copy_files(commit_id_images_dir)
+        wit.image_copy_files(commit_id_images_dir, manifest)
 
         wit.update_references_file(commit_id)
         _logger.info(
@@ -114,7 +126,7 @@ def checkout(commit_id: str) -> None:
         # Changing the original path content
         wit.copy_tree(
             src=commit_id_images_dir, dst=wit.parent_wit_dir,
-            rel=commit_id_images_dir, ignore_files=untracked
+            rel=commit_id_images_dir, ignore_files=frozenset(untracked)
         )
 
         # Changing the stage content
@@ -132,6 +144,10 @@ def checkout(commit_id: str) -> None:
 
 
 def graph(param: Optional[str] = None) -> None:
+    # Imported here since they are slow to load and only graph uses them
+    import matplotlib.pyplot as plt  # type: ignore
+    import networkx as nx  # type: ignore
+
     wit = WitStatus()
 
     plt.figure(figsize=(15, 8))
@@ -203,35 +219,36 @@ def merge(branch_name: str) -> None:
         wit_status.commit_id_dir, ancestor_dir
     )
 
-    both_changed = set.intersection(set(changed_branch), set(changed_head))
-    both_untracked = set.intersection(
-        set(untracked_branch), set(untracked_head)
-    )
+    both_changed = frozenset(changed_branch).intersection(changed_head)
+    both_untracked = frozenset(untracked_branch).intersection(untracked_head)
     are_all_ok = wit_status.check_all_changed_files(
         both_changed, both_untracked, branch_dir, ancestor_dir
     )
 
     if are_all_ok:
-        immediately_files = [
-            filename
-            for filename in changed_branch
-            if filename not in both_changed
-        ] + untracked_branch
+        immediately_files = (
+            list(set(changed_branch) - both_changed) + untracked_branch
+        )
+        known_dirs = set()
         for file in immediately_files:
             file_dir = os.path.join(branch_dir, file)
             final_dir = os.path.join(wit_status.stage_dir, file)
-            if not os.path.isdir(os.path.dirname(final_dir)):
-                wit.create_dirs(os.path.dirname(final_dir))
-            shutil.copy2(file_dir, final_dir)
+            final_parent_dir = os.path.dirname(final_dir)
+            if final_parent_dir not in known_dirs:
+                os.makedirs(final_parent_dir, exist_ok=True)
+                known_dirs.add(final_parent_dir)
+            wit.copy_file(file_dir, final_dir)
 
         for file in both_changed:
             file_merge_content = wit_status.file_after_merge(
                 file, branch_dir, wit_status.commit_id_dir, ancestor_dir
             )
             final_dir = os.path.join(wit_status.stage_dir, file)
-            if not os.path.isdir(os.path.dirname(final_dir)):
-                wit.create_dirs(os.path.dirname(final_dir))
-            with open(final_dir, 'w') as new_file:
+            final_parent_dir = os.path.dirname(final_dir)
+            if final_parent_dir not in known_dirs:
+                os.makedirs(final_parent_dir, exist_ok=True)
+                known_dirs.add(final_parent_dir)
+            with open(final_dir, 'wb') as new_file:
                 new_file.write(file_merge_content)
 
         _logger.info('The branch %s had been merged successfully', branch_name)
@@ -1,21 +1,26 @@
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-import fnmatch
+import errno
+from functools import cached_property
+import hashlib
+import io
+from itertools import zip_longest
 import logging
 import os
 import shutil
 from time import gmtime, strftime
 from typing import (
-    Callable, DefaultDict, Iterable, Iterator,
+    AbstractSet, Callable, DefaultDict, Dict, Iterable, Iterator,
     List, Optional, Tuple, Union,
 )
 
-from hashing import Hashing
-
 
 # Constants
 Text = Union[str, bytes]
 COMMIT_ID_LENGTH: int = 40
+CHUNK_SIZE: int = 1 << 20
+PARALLEL_HASH_MIN_FILES: int = 32
 
 # logging configurations
 logging.basicConfig(level=logging.INFO,
@@ -47,6 +52,7 @@ class WitManager:
         self.images_dir = self._get_images_dir()
         self.references_path = os.path.join(self.wit_dir, 'references.txt')
         self.activated_path = os.path.join(self.wit_dir, 'activated.txt')
+        self.parents_path = os.path.join(self.wit_dir, 'parents.idx')
 
     def _get_first_wit_dir(self, path: str) -> str:
         if os.path.isfile(path):
@@ -80,44 +86,83 @@ class WitManager:
         with open(self.activated_path, 'r') as file:
             return file.read()
 
-    def get_all_branches(self) -> List[str]:
+    @cached_property
+    def _refs(self) -> Dict[str, str]:
+        """Return the references file as a name to commit id dict."""
+        if not os.path.isfile(self.references_path):
+            return {}
         with open(self.references_path, 'r') as file:
             text = file.read().splitlines()
-        return [
-            line.rpartition('=')[0]
-            for line in text
-        ]
+        return {
+            name: commit_id
+            for name, _, commit_id in (line.rpartition('=') for line in text)
+        }
+
+    def get_all_branches(self) -> List[str]:
+        return list(self._refs)
 
     def get_commit_id(self, line: str = 'HEAD=') -> Optional[str]:
         """Return the last commit id done."""
-        if not os.path.isfile(self.references_path):
-            return None
-        with open(self.references_path, 'r') as file:
-            file_content = file.read().splitlines()
-        line_num = -1
-        for index, each_line in enumerate(file_content):
-            if each_line.startswith(line):
-                line_num = index
-        if line_num == -1:  # In case there is no branch as expected
-            return None
-        head_line = file_content[line_num]
-        parent_commit_id = head_line[len(line):]
-        return parent_commit_id
+        return self._refs.get(line.rstrip('='))
+
+    @cached_property
+    def _parents(self) -> Dict[str, List[str]]:
+        """Return the parents index as a commit id to parents dict."""
+        if not os.path.isfile(self.parents_path):
+            return {}
+        with open(self.parents_path, 'r') as file:
+            text = file.read().splitlines()
+        return {
+            commit_id: parents
+            for commit_id, *parents in (line.split(',') for line in text)
+        }
 
     def get_parents_of_a_file(self, image_commit_id: str) -> List[str]:
         """Return the parent commit id of an image."""
+        parents = self._parents.get(image_commit_id)
+        if parents is not None:
+            return parents
+        # Images committed before the parents index existed
         commit_id_path = os.path.join(
             self.images_dir, f'{image_commit_id}.txt'
         )
         with open(commit_id_path, 'r') as file:
             return file.read().splitlines()[0][len('parent='):].split(',')
 
+    @staticmethod
+    def hash_file(path: str) -> str:
+        """Return the hexdigest of a file content, streamed in chunks."""
+        hashed = hashlib.blake2b(digest_size=(COMMIT_ID_LENGTH // 2))
+        with open(path, 'rb', buffering=0) as file:
+            while chunk := file.read(CHUNK_SIZE):
+                hashed.update(chunk)
+        return hashed.hexdigest()
+
+    @staticmethod
+    def scan_tree(directory: str) -> Iterator[Tuple[str, List[os.DirEntry]]]:
+        """Generates every directory path with its files entries.
+
+        Parent directories are generated before their subdirectories,
+        and symbolic links to directories are not followed."""
+        stack = [directory]
+        while stack:
+            dirpath = stack.pop()
+            files = []
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            stack.append(entry.path)
+                    else:
+                        files.append(entry)
+            yield dirpath, files
+
     @staticmethod
     def get_path_files(directory: str) -> Iterator[str]:
         """Generates all the files paths in the given directory."""
-        for dirpath, _, filesnames in os.walk(directory):
-            for filename in filesnames:
-                yield os.path.join(dirpath, filename)
+        for _, files in WitManager.scan_tree(directory):
+            for entry in files:
+                yield entry.path
 
 
 class WitEditor(WitManager):
@@ -125,61 +170,68 @@ class WitEditor(WitManager):
         self, message: str, file_hash_name: str, branch_id: Optional[str]
     ) -> None:
         """Create the metadata file for the new backup."""
+        parents = [str(self.get_commit_id())]
+        if branch_id is not None:
+            parents.append(branch_id)
         new_file_path = os.path.join(self.images_dir, file_hash_name)
         with open(f'{new_file_path}.txt', 'w') as file:
-            if branch_id is None:
-                file.write(f'parent={self.get_commit_id()}\n')
-            else:
-                file.write(f'parent={self.get_commit_id()},{branch_id}\n')
+            file.write(f'parent={",".join(parents)}\n')
             file.write(
                 f'date={datetime.now().ctime()} {strftime("%z", gmtime())}\n'
                 f'message={message}'
             )
+        with open(self.parents_path, 'a') as file:
+            file.write(f'{file_hash_name},{",".join(parents)}\n')
+        if '_parents' in self.__dict__:
+            self._parents[file_hash_name] = parents
 
     def update_references_file(
         self, commit_id: str, is_branch: bool = True
     ) -> None:
         """Create the references file."""
-        if not os.path.isfile(self.references_path):
-            with open(self.references_path, 'w') as file:
-                file.write(
-                    f'HEAD={commit_id}\n'
-                    f'master={commit_id}\n'
-                )
+        if 'HEAD' not in self._refs:
+            # HEAD stays the first reference, before any early branches
+            branches = {
+                name: branch_commit_id
+                for name, branch_commit_id in self._refs.items()
+                if name != 'master'
+            }
+            self._refs.clear()
+            self._refs.update(HEAD=commit_id, master=commit_id)
+            self._refs.update(branches)
         else:
-            with open(self.references_path, 'r') as file:
-                text = file.read().splitlines()
             active_branch = self.get_active_branch()
-            current_head_commit_id = self.get_commit_id()
-            with open(self.references_path, 'w') as file:
-                file.write(f'HEAD={commit_id}\n')
-                for line in text[1:]:
-                    if (
-                        is_branch
-                        and active_branch in line
-                        and current_head_commit_id in line  # type: ignore
-                    ):
-                        file.write(f'{active_branch}={commit_id}\n')
-                    else:
-                        file.write(line + '\n')
-
-    def remove_old_branch(self, branch_name: str) -> None:
-        """Remove from the references text file a branch name, if exists."""
-        with open(self.references_path, 'r') as file:
-            text = file.read().splitlines()
-        is_branch = self.get_commit_id(f'{branch_name}=')
-        if is_branch is not None:
-            with open(self.references_path, 'w') as file:
-                for line in text:
-                    if not line.startswith(branch_name):
-                        file.write(line + '\n')
+            if (
+                is_branch
+                and self._refs.get(active_branch) == self.get_commit_id()
+            ):
+                self._refs[active_branch] = commit_id
+            self._refs['HEAD'] = commit_id
+        self._write_references_file()
 
     def update_new_branch(self, branch_name: str) -> None:
         """Update the references text file according to the branch name."""
         current_head_commit_id = self.get_commit_id()
-        self.remove_old_branch(branch_name)
-        with open(self.references_path, 'a') as file:
-            file.write(f'{branch_name}={current_head_commit_id}\n')
+        self._refs.pop(branch_name, None)
+        self._refs[branch_name] = current_head_commit_id  # type: ignore
+        self._write_references_file()
+
+    def _write_references_file(self) -> None:
+        """Replace the references file with the cached references at once."""
+        buffer = io.StringIO()
+        for name, commit_id in self._refs.items():
+            buffer.write(f'{name}={commit_id}\n')
+        data = buffer.getvalue().encode('utf-8')
+
+        temp_path = f'{self.references_path}.tmp'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            while data:
+                data = data[os.write(fd, data):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temp_path, self.references_path)
 
     def update_activated_branch(self, branch_name: str) -> None:
         """Update the activated text file to the new activated branch."""
@@ -188,33 +240,78 @@ class WitEditor(WitManager):
 
     @staticmethod
     def copy_tree(
-        src: str, dst: str, rel: str, ignore_files: Optional[List[str]] = None
+        src: str, dst: str, rel: str,
+        ignore_files: Optional[AbstractSet[str]] = None
     ) -> None:
         """Copy all the files in the real_path directory."""
-        for dirpath, dirnames, filesnames in os.walk(src):
+        for dirpath, files in WitManager.scan_tree(src):
             rel_path = os.path.relpath(dirpath, rel)
             final_dir = os.path.join(dst, rel_path)
+            os.makedirs(final_dir, exist_ok=True)
 
-            for dirname in dirnames:
-                final_dirname = os.path.join(final_dir, dirname)
-                if not os.path.isdir(final_dirname):
-                    os.mkdir(final_dirname)
-
-            for filename in filesnames:
-                file_rel_path = os.path.join(rel_path, filename)
+            for entry in files:
+                file_rel_path = os.path.join(rel_path, entry.name)
                 if not ignore_files or file_rel_path not in ignore_files:
-                    src_filename = os.path.join(dirpath, filename)
-                    shutil.copy2(src_filename, final_dir)
+                    WitEditor.copy_file(
+                        entry.path, os.path.join(final_dir, entry.name)
+                    )
 
-    def image_copy_files(self, commit_id_images_dir: str) -> None:
-        """Copy the files to the image directory."""
+    def image_copy_files(
+        self, commit_id_images_dir: str, manifest: str
+    ) -> None:
+        """Copy the files to the image directory and save their manifest."""
+        with open(f'{commit_id_images_dir}.manifest', 'w') as file:
+            file.write(manifest)
         for directory in os.listdir(self.stage_dir):
             src_copy_dir = os.path.join(self.stage_dir, directory)
             dst_copy_dir = os.path.join(commit_id_images_dir, directory)
             if os.path.isdir(src_copy_dir):
-                shutil.copytree(src_copy_dir, dst_copy_dir)
+                shutil.copytree(
+                    src_copy_dir, dst_copy_dir, copy_function=self.copy_file
+                )
             else:
-                shutil.copy2(src_copy_dir, dst_copy_dir)
+                self.copy_file(src_copy_dir, dst_copy_dir)
+
+    @staticmethod
+    def copy_file(src: str, dst: str) -> str:
+        """Copy a file with its metadata, like shutil.copy2.
+
+        The data is copied inside the kernel with os.copy_file_range when
+        the platform and the file system support it."""
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        if not WitEditor._copy_file_range(src, dst):
+            shutil.copyfile(src, dst)
+        shutil.copystat(src, dst)
+        return dst
+
+    @staticmethod
+    def _copy_file_range(src: str, dst: str) -> bool:
+        """Return False if os.copy_file_range can not copy src to dst."""
+        if not hasattr(os, 'copy_file_range'):
+            return False
+        try:
+            with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+                size = os.fstat(src_file.fileno()).st_size
+                left = size
+                while left > 0:
+                    copied = os.copy_file_range(
+                        src_file.fileno(), dst_file.fileno(), left
+                    )
+                    if copied == 0:
+                        if left == size:  # Not supported by the file system
+                            return False
+                        raise OSError(
+                            errno.EIO, f'Copy of {src} ended early', dst
+                        )
+                    left -= copied
+        except OSError as err:
+            if err.errno not in (
+                errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP
+            ):
+                raise
+            return False
+        return True
 
     @staticmethod
     def create_dirs(
@@ -229,6 +326,8 @@ class WitEditor(WitManager):
 
 
 class WitStatus(WitManager):
+    _digest_cache: Dict[Tuple[str, str, int, int], str] = {}
+
     def __init__(self) -> None:
         super().__init__()
         self.last_commit_id = self.get_commit_id()
@@ -236,9 +335,18 @@ class WitStatus(WitManager):
             self.commit_id_dir = os.path.join(
                 self.images_dir, self.last_commit_id
             )
-            self.stage_files = self._get_files(files=self.stage_dir)
-            self.commit_id_files = self._get_files(files=self.commit_id_dir)
-            self.original_files = self._get_files(files=self.real_path)
+
+    @cached_property
+    def stage_files(self) -> List[str]:
+        return self._get_files(files=self.stage_dir)
+
+    @cached_property
+    def commit_id_files(self) -> List[str]:
+        return self._get_files(files=self.commit_id_dir)
+
+    @cached_property
+    def original_files(self) -> List[str]:
+        return self._get_files(files=self.real_path)
 
     def _get_files(self, files: str) -> List[str]:
         if files != self.real_path:
@@ -256,23 +364,107 @@ class WitStatus(WitManager):
         add_files_dir: str, commit_on_files_dir: str
     ) -> Tuple[List[str], List[str]]:
         """Return the files that has changed and the not existing files."""
+        commit_on_files = set(commit_on_files_list)
         untracked_files = []
-        changed_files = []
+        tracked_stats = {}
         for file_path in add_files_list:
-            if file_path not in commit_on_files_list:
+            if file_path not in commit_on_files:
                 untracked_files.append(file_path)
             else:
-                add_path = os.path.join(add_files_dir, file_path)
-                commit_path = os.path.join(commit_on_files_dir, file_path)
-                add_content, commit_content = WitStatus.compare_files_contents(
-                    add_path, commit_path
+                tracked_stats[file_path] = (
+                    os.stat(os.path.join(add_files_dir, file_path)),
+                    os.stat(os.path.join(commit_on_files_dir, file_path)),
                 )
-                hash_add_content = Hashing.by_content(add_content)
-                hash_commit_content = Hashing.by_content(commit_content)
-                if hash_add_content != hash_commit_content:
-                    changed_files.append(file_path)
+        WitStatus.hash_files_in_parallel(
+            tracked_stats, add_files_dir, commit_on_files_dir
+        )
+        changed_files = [
+            file_path
+            for file_path, (add_stat, commit_stat) in tracked_stats.items()
+            if WitStatus.is_file_changed(
+                file_path, add_files_dir, commit_on_files_dir,
+                add_stat, commit_stat
+            )
+        ]
         return changed_files, untracked_files
 
+    @staticmethod
+    def compare_stats(
+        add_stat: os.stat_result, commit_stat: os.stat_result
+    ) -> Optional[bool]:
+        """Return whether the files changed, or None if the stats can't tell.
+
+        Files of different sizes changed, and files with the same size and
+        mtime (copy2 keeps it) did not."""
+        if add_stat.st_size != commit_stat.st_size:
+            return True
+        if add_stat.st_mtime_ns == commit_stat.st_mtime_ns:
+            return False
+        return None
+
+    @staticmethod
+    def hash_files_in_parallel(
+        files_stats: Dict[str, Tuple[os.stat_result, os.stat_result]],
+        add_files_dir: str, commit_on_files_dir: str
+    ) -> None:
+        """Fill the digests cache using several processes.
+
+        Only files that compare_stats can not decide are hashed, and only
+        when there are enough of them to pay for the processes start up."""
+        keys = []
+        for file_path, (add_stat, commit_stat) in files_stats.items():
+            if WitStatus.compare_stats(add_stat, commit_stat) is not None:
+                continue
+            for files_dir, stat in (
+                (add_files_dir, add_stat), (commit_on_files_dir, commit_stat)
+            ):
+                key = (files_dir, file_path, stat.st_mtime_ns, stat.st_size)
+                if key not in WitStatus._digest_cache:
+                    keys.append(key)
+        if len(keys) < PARALLEL_HASH_MIN_FILES:
+            return
+        paths = [
+            os.path.join(files_dir, file_path)
+            for files_dir, file_path, _, _ in keys
+        ]
+        # About four chunks per worker, to balance files of uneven sizes
+        workers = os.cpu_count() or 1
+        chunksize = max(1, len(paths) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            digests = executor.map(
+                WitStatus.hash_file, paths, chunksize=chunksize
+            )
+            WitStatus._digest_cache.update(zip(keys, digests))
+
+    @staticmethod
+    def is_file_changed(
+        file_path: str, add_files_dir: str, commit_on_files_dir: str,
+        add_stat: os.stat_result, commit_stat: os.stat_result
+    ) -> bool:
+        """Return whether the files differ, reading them only if needed."""
+        is_changed = WitStatus.compare_stats(add_stat, commit_stat)
+        if is_changed is not None:
+            return is_changed
+        add_digest = WitStatus.get_file_digest(
+            add_files_dir, file_path, add_stat
+        )
+        commit_digest = WitStatus.get_file_digest(
+            commit_on_files_dir, file_path, commit_stat
+        )
+        return add_digest != commit_digest
+
+    @staticmethod
+    def get_file_digest(
+        files_dir: str, file_path: str, stat: os.stat_result
+    ) -> str:
+        """Return the file hexdigest, hashing each file version only once."""
+        key = (files_dir, file_path, stat.st_mtime_ns, stat.st_size)
+        if key not in WitStatus._digest_cache:
+            WitStatus._digest_cache[key] = WitStatus.hash_file(
+                os.path.join(files_dir, file_path)
+            )
+        return WitStatus._digest_cache[key]
+
     @staticmethod
     def compare_files_contents(
         add_path: str, commit_path: str
@@ -302,26 +494,27 @@ class WitStatus(WitManager):
             first_content, second_content = WitStatus.compare_files_contents(
                 first_file, second_file
             )
-            first_lines = first_content.splitlines()
-            second_lines = second_content.splitlines()
-            if ancestor_dir is not None:
-                ancestor_file = os.path.join(ancestor_dir, file)
-                ancestor_content, _ = WitStatus.compare_files_contents(
-                    ancestor_file, first_file
+            if ancestor_dir is None:
+                if first_content != second_content:
+                    return False
+                continue
+
+            ancestor_file = os.path.join(ancestor_dir, file)
+            ancestor_content, _ = WitStatus.compare_files_contents(
+                ancestor_file, first_file
+            )
+            # Missing lines are None, so lines past the ancestor count as
+            # changes. Only different changes by both sides are a conflict,
+            # the same edit or deletion on both sides merges cleanly
+            if any(
+                first_line != ancestor_line and second_line != ancestor_line
+                and first_line != second_line
+                for first_line, second_line, ancestor_line in zip_longest(
+                    first_content.splitlines(), second_content.splitlines(),
+                    ancestor_content.splitlines()
                 )
-                ancestor_lines = ancestor_content.splitlines()
-
-                for index, first_line in enumerate(first_lines):
-                    second_line = second_lines[index]
-                    ancestor_line = ancestor_lines[index]
-
-                    if (
-                        first_line != ancestor_line
-                        and second_line != ancestor_line
-                    ):
-                        return False
-            else:
-                return first_content == second_content
+            ):
+                return False
 
         return True
 
@@ -340,33 +533,28 @@ class WitStatus(WitManager):
     @staticmethod
     def file_after_merge(
         file: str, first_dir: str, second_dir: str, ancestor_dir: str
-    ) -> str:
+    ) -> bytes:
         """Return a changed file after merging contents."""
-        first_file = os.path.join(first_dir, file)
-        second_file = os.path.join(second_dir, file)
-        ancestor_file = os.path.join(ancestor_dir, file)
-        first_content, second_content = WitStatus.compare_files_contents(
-            first_file, second_file
+        first_lines, second_lines, ancestor_lines = (
+            WitStatus.read_binary_lines(os.path.join(directory, file))
+            for directory in (first_dir, second_dir, ancestor_dir)
         )
-        ancestor_content, _ = WitStatus.compare_files_contents(
-            ancestor_file, first_file
+
+        # Missing lines are None, and each position keeps the side that
+        # differs from the ancestor, including lines only one side appended
+        merged_lines = (
+            first_line if first_line != ancestor_line else second_line
+            for first_line, second_line, ancestor_line in zip_longest(
+                first_lines, second_lines, ancestor_lines
+            )
         )
-        first_lines = first_content.splitlines()
-        second_lines = second_content.splitlines()
-        ancestor_lines = ancestor_content.splitlines()
-
-        new_file_str = ''
-        index = 0
-        for first_line in first_lines:
-            second_line = second_lines[index]
-            ancestor_line = ancestor_lines[index]
-            if first_line != ancestor_line:
-                new_file_str += f'{first_line}\n'
-            else:
-                new_file_str += f'{second_line}\n'
-            index += 1
-        new_file_str += '\n'.join(second_lines[index:])
-        return new_file_str
+        new_lines = [line for line in merged_lines if line is not None]
+        return b'\n'.join(new_lines) + b'\n' if new_lines else b''
+
+    @staticmethod
+    def read_binary_lines(path: str) -> List[bytes]:
+        with open(path, 'rb') as file:
+            return file.read().splitlines()
 
     def get_changes_to_be_committed(self) -> List[str]:
         changed_since_last_commit, untracked_since_last_commit = (
@@ -388,61 +576,76 @@ class WitStatus(WitManager):
             commit_id = self.last_commit_id
         commit_ids = [commit_id]
 
-        branches = self.get_all_branches()
+        branch_map = self.get_branches_by_commit(self.get_all_branches())
         return self.build_path_tree(
-            commit_ids, com_len, include_branches, branches, graph_dict
+            commit_ids, com_len, include_branches, graph_dict, branch_map
         )
 
     def build_path_tree(
         self, commit_ids: List[Optional[str]], com_len: int,
-        include_branches: bool, branches: List[str],
-        graph_dict: DefaultDict[str, List[str]]
+        include_branches: bool, graph_dict: DefaultDict[str, List[str]],
+        branch_map: Optional[Dict[str, List[str]]] = None
     ) -> DefaultDict[str, List[str]]:
-        if (
-            all(commit is None for commit in commit_ids)
-            or all(commit == 'None' for commit in commit_ids)
-        ):
-            return graph_dict
-        for commit in commit_ids:
-            if commit is not None and commit != 'None':
-                if include_branches:
-                    for branch in branches:
-                        if (
-                            commit == self.get_commit_id(line=f'{branch}=')
-                        ):
-                            graph_dict[branch].append(commit[:com_len])
-                parents_commit_ids = self.get_parents_of_a_file(commit)
-                for parent in parents_commit_ids:
-                    graph_dict[commit[:com_len]].append(parent[:com_len])
-                graph_dict.update(self.build_path_tree(
-                    parents_commit_ids, com_len, include_branches,
-                    branches, graph_dict
-                ))
-                return graph_dict
+        if branch_map is None:
+            branch_map = self.get_branches_by_commit(self.get_all_branches())
+        for commit, parents_commit_ids in self.walk_commits(commit_ids):
+            if include_branches:
+                for branch in branch_map.get(commit, ()):
+                    graph_dict[branch].append(commit[:com_len])
+            for parent in parents_commit_ids:
+                graph_dict[commit[:com_len]].append(parent[:com_len])
+        return graph_dict
+
+    def walk_commits(
+        self, commit_ids: Iterable[Optional[str]]
+    ) -> Iterator[Tuple[str, List[str]]]:
+        """Generates every commit reachable from commit_ids with its parents.
+
+        The commits are generated in BFS order, each one only once."""
+        queue = deque(commit_ids)
+        visited = set()
+        while queue:
+            commit = queue.popleft()
+            if commit is None or commit == 'None' or commit in visited:
+                continue
+            visited.add(commit)
+            parents_commit_ids = self.get_parents_of_a_file(commit)
+            yield commit, parents_commit_ids
+            queue.extend(parents_commit_ids)
 
     def build_all_graph_tree(
         self, com_len: int = 12, include_branches: bool = True
     ) -> DefaultDict[str, List[str]]:
-        graph_dict = defaultdict(list)
-        text_files = [
-            text_file[:-len('.txt')]
-            for text_file in fnmatch.filter(
-                os.listdir(self.images_dir), '*.txt'
-            )
-        ]
-        branches = self.get_all_branches()
+        graph_dict: DefaultDict[str, List[str]] = defaultdict(list)
+        with os.scandir(self.images_dir) as entries:
+            text_files = [
+                entry.name[:-len('.txt')]
+                for entry in entries
+                if entry.name.endswith('.txt')
+            ]
+        branches_by_commit = self.get_branches_by_commit(
+            self.get_all_branches()
+        )
         for commit_id in text_files:
             if include_branches:
-                for branch in branches:
-                    if (
-                        commit_id == self.get_commit_id(line=f'{branch}=')
-                    ):
-                        graph_dict[branch].append(commit_id[:com_len])
+                for branch in branches_by_commit.get(commit_id, ()):
+                    graph_dict[branch].append(commit_id[:com_len])
             parents_commit_id = self.get_parents_of_a_file(commit_id)
             for parent in parents_commit_id:
                 graph_dict[commit_id[:com_len]].append(parent[:com_len])
         return graph_dict
 
+    def get_branches_by_commit(
+        self, branches: Iterable[str]
+    ) -> DefaultDict[str, List[str]]:
+        """Return the branches names that point to every commit id."""
+        branches_by_commit: DefaultDict[str, List[str]] = defaultdict(list)
+        for branch in branches:
+            commit_id = self._refs.get(branch)
+            if commit_id:
+                branches_by_commit[commit_id].append(branch)
+        return branches_by_commit
+
     @staticmethod
     def build_graph_items(
         items_list: List[Tuple[str, List[str]]]
@@ -454,20 +657,14 @@ class WitStatus(WitManager):
     def get_lowest_common_ancestor(
         self, branch_commit_id
     ) -> Optional[str]:
-        head_tree = self.build_graph_tree(
-            param=None, com_len=COMMIT_ID_LENGTH, include_branches=False
-        )
-        branch_tree = self.build_graph_tree(
-            param=None, commit_id=branch_commit_id, com_len=COMMIT_ID_LENGTH,
-            include_branches=False
+        branch_ancestors = {
+            commit for commit, _ in self.walk_commits([branch_commit_id])
+        }
+        return next(
+            (
+                commit
+                for commit, _ in self.walk_commits([self.last_commit_id])
+                if commit in branch_ancestors
+            ),
+            None
         )
-        ancestor = self.lowest_common_ancestor_dicts(head_tree, branch_tree)
-        return ancestor
-
-    def lowest_common_ancestor_dicts(
-        self, first_dict_tree: DefaultDict[str, List[str]],
-        second_dict_tree: DefaultDict[str, List[str]]
-    ) -> Optional[str]:  # Dicts are ordered objects
-        for item in first_dict_tree:
-            if item in second_dict_tree:
-                return item